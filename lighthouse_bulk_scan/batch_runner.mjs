@@ -0,0 +1,46 @@
+// Run Lighthouse over many URLs against a single Chrome instance.
+//
+// Reads {"jobs": [{"url", "mode", "outputPath"}], "chromeFlags": [...],
+// "categories": [...], "maxWaitForLoad": ms} as JSON on stdin and writes one
+// JSON line per finished job to stdout: the job plus {"ok": bool, "error"?}.
+// Node, Lighthouse and Chrome are started once per batch instead of once per
+// URL, which is where most of the per-run wall time goes on large scans.
+import fs from 'node:fs';
+import lighthouse from 'lighthouse';
+import desktopConfig from 'lighthouse/core/config/desktop-config.js';
+import * as chromeLauncher from 'chrome-launcher';
+
+const MOBILE_SCREEN = {mobile: true, width: 375, height: 667, deviceScaleFactor: 2, disabled: false};
+
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const chrome = await chromeLauncher.launch({chromeFlags: input.chromeFlags});
+
+try {
+  for (const job of input.jobs) {
+    const flags = {
+      port: chrome.port,
+      output: 'json',
+      onlyCategories: input.categories,
+      maxWaitForLoad: input.maxWaitForLoad,
+      disableStorageReset: true,
+    };
+    if (job.mode === 'mobile') {
+      Object.assign(flags, {formFactor: 'mobile', screenEmulation: MOBILE_SCREEN});
+    }
+    try {
+      const result = await lighthouse(job.url, flags, job.mode === 'desktop' ? desktopConfig : undefined);
+      if (!result) {
+        throw new Error('Lighthouse returned no result');
+      }
+      // Write then rename, so an interrupted run never leaves a partial report.
+      const tmpPath = `${job.outputPath}.tmp`;
+      fs.writeFileSync(tmpPath, result.report);
+      fs.renameSync(tmpPath, job.outputPath);
+      process.stdout.write(JSON.stringify({...job, ok: true}) + '\n');
+    } catch (err) {
+      process.stdout.write(JSON.stringify({...job, ok: false, error: String(err)}) + '\n');
+    }
+  }
+} finally {
+  await chrome.kill();
+}
@@ -3,9 +3,17 @@ import csv
 import json
 import logging
 import argparse
+import shutil
+import signal
+import asyncio
+import multiprocessing
 import pandas as pd
 import re
+from collections import defaultdict, deque
+from contextlib import ExitStack, nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from urllib.parse import urlparse
 from typing import Any
 
@@ -14,26 +22,203 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     yaml = None
 
-from .sitemap import fetch_sitemaps_from_robots, parse_sitemap
-from .runner import get_lighthouse_path, run_lighthouse
-from .report import extract_detailed_data
+from .sitemap import (
+    enable_http_cache, enable_sitemap_cache, fetch_sitemaps_from_robots, get_valid_url, parse_sitemaps,
+    save_sitemap_cache,
+)
+from .runner import get_chrome_path, get_lighthouse_path, run_lighthouse, run_lighthouse_batch, shared_chrome
+from .report import CATEGORY_SCORES, DISPLAY_AUDITS, REPORT_COLUMNS, extract_detailed_data
+
+_NON_NUMERIC_RE = re.compile(r'[^0-9.]')
 
 def parse_display_value(val):
     """Extract numeric portion from strings like '1.2 s' or '240 ms'."""
     if not val:
         return None
     # Remove all non-digit and non-decimal characters
-    val_str = re.sub(r'[^0-9.]', '', val)
+    val_str = _NON_NUMERIC_RE.sub('', val)
     try:
         return float(val_str) if val_str else None
     except ValueError:
         return None
 
+def parse_display_values(values):
+    """
+    Vectorized parse_display_value over a whole column, using pandas string
+    kernels instead of a Python call per row. Unparseable values become NaN.
+    """
+    digits = values.astype(str).str.replace(_NON_NUMERIC_RE, '', regex=True)
+    return pd.to_numeric(digits, errors='coerce')
+
+def _read_csv_column_arrow(path, max_rows):
+    """
+    First column of a CSV via pyarrow's streaming reader, stopping once
+    max_rows rows have been read. Returns None when the pandas fallback is
+    needed: pyarrow isn't installed (it is imported here, so other modes
+    don't pay for it at startup), or rows have differing column counts
+    (pyarrow also rejects empty files).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return None
+    try:
+        reader = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=["f0"], column_types={"f0": pa.string()}),
+        )
+        values = []
+        for batch in reader:
+            values.extend(batch.column(0).to_pylist())
+            if len(values) >= max_rows:
+                break
+    except pa.ArrowInvalid:
+        return None
+    return values[:max_rows]
+
+def read_csv_urls(path, max_urls):
+    """
+    Return the stripped, non-blank values of column A of a CSV file, reading
+    at most max_urls rows. Uses pyarrow's multithreaded CSV reader when
+    installed, falling back to pandas' C parser, which also copes with rows
+    of differing lengths.
+    """
+    values = _read_csv_column_arrow(path, max_urls)
+    if values is not None:
+        return [url for url in (v.strip() for v in values if v) if url]
+    try:
+        first_col = pd.read_csv(
+            path, header=None, usecols=[0], dtype=str, nrows=max_urls, encoding='utf-8'
+        )[0].dropna().str.strip()
+    except pd.errors.EmptyDataError:
+        return []
+    return first_col[first_col != ""].tolist()
+
+@lru_cache(maxsize=None)
 def get_domain_from_url(url):
-    """Attempt to parse domain from a given URL."""
+    """Attempt to parse domain from a given URL. Cached, since the per-host limiter looks up every job's URL."""
     parsed = urlparse(url)
     return parsed.netloc or "unknown-domain"
 
+# Columns of the per-run result rows (report fields plus run number).
+RESULT_COLUMNS = [*REPORT_COLUMNS, "run_iteration"]
+
+# Audit modes, in the order their average rows are written.
+MODE_DTYPE = pd.CategoricalDtype(["desktop", "mobile"])
+
+# Parsing a report takes tens of ms while a Lighthouse run takes seconds, so
+# a couple of worker processes keep up with any realistic --concurrency.
+REPORT_PARSE_WORKERS = 2
+
+def _ignore_sigint():
+    """Pool initializer: leave Ctrl+C to the main process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def make_report_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for extract_detailed_data. Workers ignore SIGINT, so on
+    Ctrl+C they finish the reports already queued and the checkpoint keeps
+    them, and are started fresh (forkserver, or spawn where fork-based
+    methods aren't available) rather than forked from our threaded process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(
+        max_workers=REPORT_PARSE_WORKERS, mp_context=context, initializer=_ignore_sigint
+    )
+
+def write_parsed_rows(parsed, writer, wait_all=False):
+    """
+    Pop finished (future, run_iter) entries off the front of `parsed` and
+    write their rows to the checkpoint CSV, keeping submission order. Stops at
+    the first report still being parsed unless wait_all is set.
+    Returns the number of rows written.
+    """
+    written = 0
+    while parsed and (wait_all or parsed[0][0].done()):
+        future, run_iter = parsed.popleft()
+        try:
+            data = future.result()
+        except Exception as e:
+            logging.error(f"Failed to parse Lighthouse report for run={run_iter}: {e}")
+            continue
+        if not data:
+            continue
+        data["run_iteration"] = run_iter
+        writer.writerow(data)
+        written += 1
+    return written
+
+# With --max-per-host, the most jobs that may be read ahead of the job
+# iterator and set aside while their host is at its limit.
+MAX_QUEUED_JOBS = 1000
+
+async def run_audits(jobs, concurrency, on_report, max_per_host=0, **lighthouse_kwargs):
+    """
+    Audit every (url, run_iter, mode) job with at most `concurrency`
+    Lighthouse runs in flight (and at most `max_per_host` per host, if set),
+    calling on_report(url, run_iter, mode, report_json) as each one finishes.
+    A job whose host is at its limit is set aside and the next job for a host
+    with a free slot starts instead, so one busy host never holds every slot.
+    Jobs are read lazily (at most MAX_QUEUED_JOBS set aside at once), so
+    memory stays flat however many jobs there are.
+    """
+    job_iter = iter(jobs)
+    waiting = defaultdict(deque)  # host -> jobs set aside until it has a free slot
+    queued = 0
+    active = defaultdict(int)  # host -> runs in flight
+    running = {}  # task -> (host, job)
+
+    def has_slot(host):
+        return not max_per_host or active[host] < max_per_host
+
+    def next_job():
+        """The next (host, job) that may start now, or None."""
+        nonlocal queued
+        for host, host_jobs in waiting.items():
+            if has_slot(host):
+                job = host_jobs.popleft()
+                queued -= 1
+                if not host_jobs:
+                    del waiting[host]
+                return host, job
+        while queued < MAX_QUEUED_JOBS:
+            job = next(job_iter, None)
+            if job is None:
+                return None
+            host = get_domain_from_url(job[0])
+            if has_slot(host):
+                return host, job
+            waiting[host].append(job)
+            queued += 1
+        return None
+
+    try:
+        while True:
+            while len(running) < max(1, concurrency):
+                picked = next_job()
+                if picked is None:
+                    break
+                host, (url, run_iter, mode, output_dir) = picked
+                active[host] += 1
+                logging.info(f"RUN {run_iter} - {mode.capitalize()}: {url}")
+                task = asyncio.ensure_future(run_lighthouse(
+                    url=url, mode=mode, output_dir=output_dir, **lighthouse_kwargs
+                ))
+                running[task] = picked
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                host, (url, run_iter, mode, _) = running.pop(task)
+                active[host] -= 1
+                on_report(url, run_iter, mode, task.result())
+    finally:
+        for task in running:
+            task.cancel()
+
 def main():
     """
     Lighthouse bulk audit script with:
@@ -58,6 +243,14 @@ def main():
     parser.add_argument("--csv-input-file", default="",
                         help="Path to a CSV file with URLs in the first column (sitemaps ignored if set).")
     parser.add_argument("--config-file", default="", help="Optional YAML/JSON config file with defaults.")
+    parser.add_argument("--async-sitemaps", action="store_true",
+                        help="Fetch sitemaps with an async HTTP/2 client (requires httpx[http2]).")
+    parser.add_argument("--http-cache-ttl", type=int, default=0,
+                        help="Cache robots.txt/sitemap responses on disk for this many seconds, so rescans "
+                             "of the same site skip URL discovery (requires requests-cache). Default=0 (off).")
+    parser.add_argument("--sitemap-cache", action="store_true",
+                        help="Keep each sitemap's ETag/Last-Modified and URLs in <output-dir>/sitemap_cache.json "
+                             "and revalidate them on the next scan, skipping sitemaps the server reports unchanged.")
 
     # Limits & outputs
     parser.add_argument("--max-urls", type=int, default=99999,
@@ -67,6 +260,9 @@ def main():
     parser.add_argument("--csv-output", default="lighthouse_summary.csv",
                         help="(Legacy) final CSV name if needed; we now store domain-timestamp CSV inside /reports.")
     parser.add_argument("--db-uri", default="", help="SQLAlchemy DB URI for saving results (optional).")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Also write the typed per-run rows to a zstd-compressed Parquet file "
+                             "next to the summary CSV (requires pyarrow).")
 
     # Lighthouse & logging
     parser.add_argument("--lighthouse-path", default="",
@@ -78,12 +274,41 @@ def main():
     parser.add_argument("--log-file", default="", help="Optional path to log file.")
     parser.add_argument("--verbose-lh", action="store_true",
                         help="Pass --verbose to Lighthouse for extra Lighthouse logs.")
+    parser.add_argument("--discard-reports", action="store_true",
+                        help="Delete this scan's run_N report folders once the summary is written.")
+    parser.add_argument("--save-assets", action="store_true",
+                        help="Keep Lighthouse's trace and devtools log next to each report (large).")
+    parser.add_argument("--shared-chrome", action="store_true",
+                        help="Launch Chrome once and attach every Lighthouse run to it via --port, instead of "
+                             "starting a browser per run. Audits then run one at a time.")
+    parser.add_argument("--chrome-path", default="",
+                        help="Path to Chrome/Chromium for --shared-chrome (default: $CHROME_PATH, then PATH).")
+    parser.add_argument("--chrome-port", type=int, default=9222,
+                        help="Remote debugging port for --shared-chrome. Default=9222.")
+    parser.add_argument("--node-runner", action="store_true",
+                        help="Run audits through the bundled Node batch runner, reusing one Chrome per worker "
+                             "(requires `npm install` in the repository root).")
+    parser.add_argument("--node-workers", type=int, default=1,
+                        help="Number of Node batch runner processes when --node-runner is set. Default=1.")
+    parser.add_argument("--node-path", default="node",
+                        help="Path to the Node.js executable used by --node-runner.")
+
+    # Concurrency
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Max Lighthouse runs in flight at once. Default=1. Parallel runs compete for "
+                             "CPU and skew timing metrics (TBT, LCP, TTI), so raise this for throughput, "
+                             "not for benchmark-grade numbers.")
+    parser.add_argument("--max-per-host", type=int, default=0,
+                        help="Max concurrent Lighthouse runs against any one host (0 = no extra limit).")
 
     # Timeout & multiple runs
     parser.add_argument("--per-url-timeout", type=int, default=120,
                         help="Max seconds allowed for each Lighthouse run (desktop/mobile). Default=120.")
     parser.add_argument("--runs-per-url", type=int, default=1,
                         help="Number of times to test each URL (desktop & mobile unless disabled). Default=1.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the most recent run_N folders, reusing reports that already exist "
+                             "instead of starting new runs.")
 
     args, unknown_lh_flags = parser.parse_known_args()
 
@@ -133,14 +358,8 @@ def main():
         if not os.path.isfile(args.csv_input_file):
             logging.error(f"CSV file not found: {args.csv_input_file}")
             return
-        urls_to_process = []
         logging.debug(f"Reading CSV: {args.csv_input_file}")
-        with open(args.csv_input_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if row and row[0].strip():
-                    urls_to_process.append(row[0].strip())
-        urls_to_process = urls_to_process[:args.max_urls]
+        urls_to_process = read_csv_urls(args.csv_input_file, args.max_urls)
         logging.debug(f"Loaded {len(urls_to_process)} URLs (capped at {args.max_urls}).")
 
     else:
@@ -149,25 +368,35 @@ def main():
         if not base_domain:
             logging.error("No --base-url, --url-target, or --csv-input-file given. Exiting.")
             return
-        logging.debug(f"Fetching sitemaps for domain: {base_domain}")
-        sitemaps = fetch_sitemaps_from_robots(f"http://{base_domain}")
+        if args.http_cache_ttl > 0:
+            enable_http_cache(os.path.join(args.output_dir, "http_cache"), args.http_cache_ttl)
+            if args.async_sitemaps:
+                logging.warning("--http-cache-ttl only covers robots.txt and the site probe with --async-sitemaps")
+        site_url = get_valid_url(base_domain)
+        logging.debug(f"Fetching sitemaps for domain: {base_domain} ({site_url})")
+        sitemaps = fetch_sitemaps_from_robots(site_url)
         if not sitemaps:
             sitemaps = [
-                f"http://{base_domain.rstrip('/')}/sitemap.xml",
-                f"http://{base_domain.rstrip('/')}/sitemap_index.xml"
+                f"{site_url}/sitemap.xml",
+                f"{site_url}/sitemap_index.xml"
             ]
             logging.warning("No sitemaps discovered in robots.txt, using fallback patterns.")
-        all_urls = set()
-        for sm in sitemaps:
-            all_urls.update(parse_sitemap(sm))
-        urls_to_process = list(all_urls)[:args.max_urls]
-        logging.debug(f"Discovered {len(all_urls)} unique URLs; "
-                      f"capped at {args.max_urls} => {len(urls_to_process)} remain.")
+        if args.async_sitemaps:
+            # Deferred so httpx is only loaded when it is actually used.
+            from .sitemap_async import parse_sitemaps_async as walk_sitemaps
+        else:
+            walk_sitemaps = parse_sitemaps
+        if args.sitemap_cache:
+            enable_sitemap_cache(os.path.join(args.output_dir, "sitemap_cache.json"))
+        urls_to_process = walk_sitemaps(sitemaps, max_urls=args.max_urls)
+        save_sitemap_cache()
+        logging.debug(f"Discovered {len(urls_to_process)} unique URLs (capped at {args.max_urls}).")
 
     logging.info(f"Total URLs to process: {len(urls_to_process)}")
 
     # 3) Lighthouse path detection
-    lighthouse_exe = get_lighthouse_path(args.lighthouse_path)
+    # (The Node batch runner imports Lighthouse as a library instead.)
+    lighthouse_exe = "" if args.node_runner else get_lighthouse_path(args.lighthouse_path)
     logging.debug(f"Lighthouse executable: {lighthouse_exe}")
 
     # Determine domain label (for naming output CSV).
@@ -183,138 +412,175 @@ def main():
 
     # Prepare /reports folder and final CSV path
     report_dir = os.path.join(args.output_dir, "reports")
-    os.makedirs(report_dir, exist_ok=True)
     timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
     csv_filename = f"{domain_label}-{timestamp_str}.csv"
     csv_output_path = os.path.join(report_dir, csv_filename)
+    # Rows are appended here as each report is parsed, so memory stays flat
+    # and a crash leaves every finished result on disk.
+    rows_path = os.path.join(report_dir, f"{domain_label}-{timestamp_str}.partial.csv")
 
     # ----------------------------------------------------------------------
     # 4) Detect prior run_X folders, so we don't overwrite old results
     # If you do multiple runs (e.g., run the script again), it auto-finds
     # the highest run_N folder and continues from run_(N+1) onward.
     # ----------------------------------------------------------------------
-    existing_runs = [
-        d for d in os.listdir(args.output_dir)
-        if d.startswith("run_") and os.path.isdir(os.path.join(args.output_dir, d))
-    ]
-    max_run_found = 0
-    for run_folder in existing_runs:
-        try:
-            num = int(run_folder.split("_")[1])
-            if num > max_run_found:
-                max_run_found = num
-        except ValueError:
-            continue
-
-    # We start from (max_run_found+1) up to (max_run_found + runs_per_url)
-    start_run = max_run_found + 1
-    end_run = max_run_found + args.runs_per_url
+    # Single pass; scandir's is_dir() avoids a stat() per entry.
+    max_run_found = max(
+        (
+            int(entry.name.split("_")[1])
+            for entry in os.scandir(args.output_dir)
+            if entry.name.startswith("run_") and entry.name.split("_")[1].isdigit() and entry.is_dir()
+        ),
+        default=0,
+    )
 
-    results = []
+    # We start from (max_run_found+1) up to (max_run_found + runs_per_url).
+    # With --resume, we instead re-enter the last runs_per_url folders.
+    if args.resume:
+        start_run = max(max_run_found - args.runs_per_url + 1, 1)
+    else:
+        start_run = max_run_found + 1
+    end_run = start_run + args.runs_per_url - 1
+
+    modes = ["desktop"] if args.disable_mobile else ["desktop", "mobile"]
+
+    run_dirs = {
+        run_iter: os.path.join(args.output_dir, f"run_{run_iter}")
+        for run_iter in range(start_run, end_run + 1)
+    }
+
+    def record_report(url, run_iter, mode, report_json):
+        """Queue a finished report for parsing and write any rows that are ready."""
+        nonlocal rows_written
+        if report_json:
+            parsed.append((report_pool.submit(extract_detailed_data, report_json, mode), run_iter))
+            rows_written += write_parsed_rows(parsed, rows_writer)
+            rows_file.flush()
+        else:
+            logging.debug(f"No {mode} JSON for run={run_iter}: {url}")
+
+    interrupted = False
+    # Find Chrome and start the shared browser before anything is created on
+    # disk, so a missing Chrome doesn't leave a stale, empty checkpoint and
+    # run folder behind. Until setup is done, a failure or Ctrl+C stops
+    # Chrome right here; after that, pop_all() hands it to `chrome`, which is
+    # closed once the audits end.
+    with ExitStack() as setup:
+        port = None
+        if args.shared_chrome and not args.node_runner:
+            port = setup.enter_context(shared_chrome(get_chrome_path(args.chrome_path), port=args.chrome_port))
+
+        # Create this scan's folders up front (e.g. "lighthouse_reports/run_2"),
+        # rather than once per job from inside the concurrent workers.
+        os.makedirs(report_dir, exist_ok=True)
+        for run_dir in run_dirs.values():
+            os.makedirs(run_dir, exist_ok=True)
+
+        # Report parsing is CPU-bound, so it runs in worker processes while the
+        # next Lighthouse audit is already under way. Holds (future, run_iter).
+        report_pool = make_report_pool()
+        parsed = deque()
+        rows_written = 0
+        rows_file = open(rows_path, "w", newline="", encoding="utf-8")
+        # Every row follows the same column template, so skip DictWriter's
+        # per-row check for unexpected keys.
+        rows_writer = csv.DictWriter(rows_file, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        rows_writer.writeheader()
+        chrome = setup.pop_all()
 
     try:
-        for url in urls_to_process:
-            for run_iter in range(start_run, end_run + 1):
-                # Create subfolder for this run, e.g. "lighthouse_reports/run_2"
-                run_subfolder = os.path.join(args.output_dir, f"run_{run_iter}")
-                os.makedirs(run_subfolder, exist_ok=True)
-
-                logging.info(f"RUN {run_iter} - Desktop: {url}")
-                desktop_json = run_lighthouse(
-                    url=url,
-                    mode="desktop",
-                    output_dir=run_subfolder,
-                    lighthouse_exe=lighthouse_exe,
-                    extra_flags=unknown_lh_flags,
-                    timeout_secs=args.per_url_timeout
-                )
-                if desktop_json:
-                    desk_data = extract_detailed_data(desktop_json, "desktop")
-                    desk_data["run_iteration"] = run_iter
-                    results.append(desk_data)
-                else:
-                    logging.debug(f"No desktop JSON for run={run_iter}: {url}")
-
-                if not args.disable_mobile:
-                    logging.info(f"RUN {run_iter} - Mobile: {url}")
-                    mobile_json = run_lighthouse(
-                        url=url,
-                        mode="mobile",
-                        output_dir=run_subfolder,
-                        lighthouse_exe=lighthouse_exe,
-                        extra_flags=unknown_lh_flags,
-                        timeout_secs=args.per_url_timeout
-                    )
-                    if mobile_json:
-                        mob_data = extract_detailed_data(mobile_json, "mobile")
-                        mob_data["run_iteration"] = run_iter
-                        results.append(mob_data)
-                    else:
-                        logging.debug(f"No mobile JSON for run={run_iter}: {url}")
+        if args.node_runner:
+            if unknown_lh_flags:
+                logging.warning(f"Extra Lighthouse flags are ignored by --node-runner: {unknown_lh_flags}")
+            if args.save_assets:
+                logging.warning("--save-assets is ignored by --node-runner")
+            if args.shared_chrome:
+                logging.warning("--shared-chrome is ignored by --node-runner, which already shares Chrome per worker")
+            for run_iter, run_subfolder in run_dirs.items():
+                logging.info(f"RUN {run_iter} - Batch of {len(urls_to_process) * len(modes)} audits")
+                jobs = [(url, mode, run_subfolder) for url in urls_to_process for mode in modes]
+                for url, mode, report_json in run_lighthouse_batch(
+                    jobs,
+                    node_exe=args.node_path,
+                    workers=args.node_workers,
+                    timeout_secs=args.per_url_timeout,
+                    resume=args.resume
+                ):
+                    record_report(url, run_iter, mode, report_json)
+        else:
+            jobs = (
+                (url, run_iter, mode, run_dir)
+                for url in urls_to_process
+                for run_iter, run_dir in run_dirs.items()
+                for mode in modes
+            )
+            concurrency = args.concurrency
+            if args.shared_chrome:
+                # Lighthouse runs must not overlap in a single browser.
+                if concurrency > 1:
+                    logging.info("--shared-chrome: running audits one at a time")
+                concurrency = 1
+            asyncio.run(run_audits(
+                jobs,
+                concurrency=concurrency,
+                max_per_host=args.max_per_host,
+                on_report=record_report,
+                lighthouse_exe=lighthouse_exe,
+                extra_flags=unknown_lh_flags,
+                timeout_secs=args.per_url_timeout,
+                resume=args.resume,
+                save_assets=args.save_assets,
+                port=port
+            ))
 
     except KeyboardInterrupt:
         logging.warning("KeyboardInterrupt: Stopping early. Partial results will still be saved.")
+        interrupted = True
+    finally:
+        chrome.close()
+
+    rows_written += write_parsed_rows(parsed, rows_writer, wait_all=True)
+    rows_file.close()
+    report_pool.shutdown()
 
     # 5) Save aggregated CSV with top 2 rows (avg desktop, avg mobile), then all runs
-    if results:
-        df = pd.DataFrame(results)
+    if rows_written:
+        # Read everything back as text (mode as a two-value categorical); the
+        # numeric columns are converted below.
+        df = pd.read_csv(rows_path, dtype={**dict.fromkeys(RESULT_COLUMNS, str), "mode": MODE_DTYPE},
+                         keep_default_na=False)
+        df["run_iteration"] = pd.to_numeric(df["run_iteration"])
 
         # Convert numeric-like columns
-        numeric_cols = [
-            "performance_score",
-            "accessibility_score",
-            "best_practices_score",
-            "seo_score",
-            "timing_total",
-            "first_contentful_paint",
-            "largest_contentful_paint",
-            "interactive",
-            "speed_index",
-            "total_blocking_time",
-            "cumulative_layout_shift",
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                # Parse the "displayValue" columns that might have strings like "1.2 s"
-                if col in [
-                    "first_contentful_paint", "largest_contentful_paint",
-                    "interactive", "speed_index", "total_blocking_time",
-                    "cumulative_layout_shift"
-                ]:
-                    df[col] = df[col].apply(parse_display_value)
-                # Convert to numeric
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        # Separate Desktop & Mobile subsets
-        desktop_df = df[df['mode'] == 'desktop']
-        mobile_df = df[df['mode'] == 'mobile']
-
-        # Compute the average for each group, even if there's only 1 row
-        desktop_avg = desktop_df[numeric_cols].mean(numeric_only=True) if not desktop_df.empty else pd.Series()
-        mobile_avg = mobile_df[numeric_cols].mean(numeric_only=True) if not mobile_df.empty else pd.Series()
-
-        # Prepare row dicts
-        desktop_row = {'mode': 'desktop-AVERAGE'}
-        mobile_row  = {'mode': 'mobile-AVERAGE'}
-
-        for col in df.columns:
-            if col in ['mode']:
-                continue
-            if col in desktop_avg:
-                desktop_row[col] = desktop_avg[col]
-            else:
-                desktop_row[col] = '---'
-
-            if col in mobile_avg:
-                mobile_row[col] = mobile_avg[col]
-            else:
-                mobile_row[col] = '---'
-
-        avg_df = pd.DataFrame([desktop_row, mobile_row])
+        score_cols = [column for column, _ in CATEGORY_SCORES] + ["timing_total"]
+        display_cols = [column for column, _ in DISPLAY_AUDITS]
+        numeric_cols = score_cols + display_cols
+        # Parse the "displayValue" columns that might have strings like "1.2 s"
+        df[display_cols] = df[display_cols].apply(parse_display_values)
+        df[score_cols] = df[score_cols].apply(pd.to_numeric, errors='coerce')
+        # Floats throughout, even where every value happens to be whole.
+        df[numeric_cols] = df[numeric_cols].astype("float64")
+
+        # One groupby for every mode's averages, even if there's only 1 row.
+        # Average rows are '---' in every column, then the averaged numeric
+        # columns; a mode with no rows (e.g. --disable-mobile) stays all '---'.
+        means = df.groupby("mode", observed=True)[numeric_cols].mean()
+        avg_df = pd.DataFrame("---", index=MODE_DTYPE.categories, columns=df.columns, dtype=object)
+        avg_df.loc[means.index.astype(str), numeric_cols] = means.to_numpy()
+        avg_df["mode"] = avg_df.index + "-AVERAGE"
         final_df = pd.concat([avg_df, df], ignore_index=True)
 
         final_df.to_csv(csv_output_path, index=False)
         logging.info(f"Saved {len(df)} results (all runs) to {csv_output_path}")
+        if args.parquet:
+            # Per-run rows only: the average rows mix '---' into numeric
+            # columns, and are cheap to recompute from typed data.
+            parquet_path = os.path.splitext(csv_output_path)[0] + ".parquet"
+            try:
+                df.to_parquet(parquet_path, index=False, compression="zstd")
+                logging.info(f"Saved {len(df)} results (all runs) to {parquet_path}")
+            except ImportError as e:
+                logging.error(f"Failed to write Parquet output: {e}")
         if args.db_uri:
             try:
                 from sqlalchemy import create_engine
@@ -325,6 +591,13 @@ def main():
                 logging.error(f"Failed to write to database: {e}")
     else:
         logging.warning("No successful Lighthouse runs, no CSV written.")
+    os.remove(rows_path)
+
+    # Keep the reports of an interrupted scan so --resume can pick them up.
+    if args.discard_reports and not interrupted:
+        for run_dir in run_dirs.values():
+            shutil.rmtree(run_dir, ignore_errors=True)
+        logging.info("Removed this scan's Lighthouse JSON reports (--discard-reports)")
 
     logging.info("All audits complete.")
 
@@ -1,11 +1,33 @@
 """Helpers for running the Lighthouse CLI."""
 
 import os
+import asyncio
+import json
 import subprocess
 import logging
+import shutil
 import tempfile
 import time
-from typing import Optional
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from .report import loads_json
+
+# Node driver that runs many URLs against one Chrome (see run_lighthouse_batch).
+BATCH_RUNNER_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_runner.mjs")
+
+LIGHTHOUSE_CATEGORIES = ("performance", "accessibility", "best-practices", "seo")
+
+# Reports at or below this size are considered incomplete when resuming.
+MIN_REPORT_BYTES = 1024
+
+# Headless Chrome flags shared by both runners. No --user-data-dir here: every
+# Chrome gets its own throwaway profile, since concurrent Chromes cannot share
+# one.
+BATCH_CHROME_FLAGS = ["--headless", "--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
 
 def get_lighthouse_path(custom_path: str = "") -> str:
     """
@@ -30,59 +52,150 @@ def get_lighthouse_path(custom_path: str = "") -> str:
         "Could not locate Lighthouse. Please install globally or specify --lighthouse-path."
     )
 
-def run_lighthouse(
+# Executable names tried on PATH when no Chrome path is given.
+CHROME_CANDIDATES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+def get_chrome_path(custom_path: str = "") -> str:
+    """
+    Return the path to a Chrome/Chromium executable: custom_path if it
+    exists, then $CHROME_PATH (as chrome-launcher uses), then PATH.
+    """
+    for path in (custom_path, os.getenv("CHROME_PATH", "")):
+        if path and os.path.isfile(path):
+            return path
+    for name in CHROME_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise FileNotFoundError(
+        "Could not locate Chrome. Please install it, set CHROME_PATH, or specify --chrome-path."
+    )
+
+@contextmanager
+def _temp_profile() -> Iterator[str]:
+    """
+    Yield a throwaway Chrome user-data-dir and remove it afterwards. Chrome
+    may still hold files in it for a moment after exiting on Windows; a
+    leftover temp dir is harmless, so cleanup errors are ignored.
+    """
+    profile_dir = tempfile.mkdtemp(prefix="lighthouse_profile_")
+    try:
+        yield profile_dir
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+@contextmanager
+def shared_chrome(chrome_exe: str, port: int = 9222, startup_timeout: int = 30) -> Iterator[int]:
+    """
+    Launch one headless Chrome with remote debugging on `port` and yield the
+    port once DevTools answers, so every Lighthouse run can attach to it
+    (run_lighthouse(port=...)) instead of starting its own browser.
+    Chrome and its throwaway profile are removed on exit.
+    """
+    with _temp_profile() as profile_dir:
+        cmd = [chrome_exe, *BATCH_CHROME_FLAGS, f"--remote-debugging-port={port}", f"--user-data-dir={profile_dir}"]
+        logging.debug(f"Starting shared Chrome: {' '.join(cmd)}")
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=1):
+                        break
+                except OSError:
+                    if proc.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"Chrome did not start listening on port {port}")
+                    time.sleep(0.2)
+            logging.info(f"Shared Chrome listening on port {port}")
+            yield port
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+# Path separators and query punctuation, plus the rest of the characters
+# Windows refuses in file names.
+_UNSAFE_CHARS = str.maketrans(dict.fromkeys('/?&:\\*"<>|', "_"))
+
+@lru_cache(maxsize=None)
+def safe_name(url: str) -> str:
+    """
+    Turn a URL into a filesystem-safe report name: scheme stripped, then one
+    translate() pass over the unsafe characters. Cached, since every URL is
+    mangled once per mode and per run.
+    """
+    if url.startswith("https://"):
+        url = url[8:]
+    elif url.startswith("http://"):
+        url = url[7:]
+    return url.translate(_UNSAFE_CHARS)
+
+def has_report(path: str) -> bool:
+    """
+    True if a finished report already exists at path. Anything under
+    MIN_REPORT_BYTES is treated as a truncated write from an interrupted run.
+    """
+    return os.path.isfile(path) and os.path.getsize(path) > MIN_REPORT_BYTES
+
+def _kill(proc: asyncio.subprocess.Process) -> None:
+    """
+    Kill proc unless it is already gone. On Ctrl+C the whole process group
+    gets SIGINT, so Lighthouse has often exited before we get to kill it.
+    """
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+
+async def run_lighthouse(
     url: str,
     mode: str,
     output_dir: str,
     lighthouse_exe: str,
     extra_flags: list[str],
-    timeout_secs: int = 120
+    timeout_secs: int = 120,
+    resume: bool = False,
+    save_assets: bool = False,
+    port: Optional[int] = None
 ) -> Optional[str]:
     """
-    Run Lighthouse on Windows/Mac/Linux without ephemeral random profiles.
-    1) Use a persistent user-data-dir so we don't rely on ephemeral folders that get locked.
-    2) Sleep briefly after the run to avoid Windows holding file locks.
-    3) Return path to JSON or None if LH fails/times out.
-    """
-
-    # Hardcode a persistent user-data-dir:
-    #   On Windows, e.g. C:\lighthouse_profile
-    #   On Mac/Linux, e.g. /tmp/lighthouse_profile
-    # (You can also let the user choose a path via CLI if you like.)
-    custom_profile_dir = r"C:\lighthouse_profile" if os.name == "nt" else "/tmp/lighthouse_profile"
-
-    # If user didn't supply --chrome-flags, we'll use our set
-    if not any("--chrome-flags" in f for f in extra_flags):
-        default_flags = [
-            "--headless",
-            "--disable-gpu",
-            "--disable-dev-shm-usage",
-            "--no-sandbox",
-            f'--user-data-dir="{custom_profile_dir}"'
-        ]
-        extra_flags.append(f'--chrome-flags="{" ".join(default_flags)}"')
+    Run Lighthouse on Windows/Mac/Linux as an asyncio child process, so many
+    runs can be awaited side by side without a thread each.
+    1) Give each run its own throwaway user-data-dir, so concurrent Chromes
+       never contend for (or lock) a shared profile.
+    2) Kill the child if it outlives timeout_secs.
+    3) Take the report from Lighthouse's stdout and write it with one
+       write-then-rename, so a killed run never leaves a truncated report.
+    4) Return path to JSON or None if LH fails/times out.
+    With resume=True, an existing report for this URL/mode is reused instead.
+    save_assets=True also keeps Lighthouse's trace and devtools log (tens of MB
+    per run) next to the report. With port set, Lighthouse attaches to the
+    Chrome already listening there (see shared_chrome) instead of launching one.
+    """
 
     # Build a sanitized output filename
-    safe_url = (
-        url.replace("https://", "")
-           .replace("http://", "")
-           .replace("/", "_")
-           .replace("?", "_")
-           .replace("&", "_")
-           .replace(":", "_")
-    )
-    out_file = os.path.join(output_dir, f"{safe_url}_{mode}.json")
+    out_file = os.path.join(output_dir, f"{safe_name(url)}_{mode}.json")
+    if resume and has_report(out_file):
+        logging.info(f"Reusing existing report ({mode}): {out_file}")
+        return out_file
 
     # Base LH command
     cmd = [
         lighthouse_exe,
         url,
         "--output=json",
-        f"--output-path={out_file}",
-        "--only-categories=performance,accessibility,best-practices,seo",
-        "--save-assets",
+        f"--only-categories={','.join(LIGHTHOUSE_CATEGORIES)}",
         "--disable-storage-reset"  # don't forcibly remove user-data
     ]
+    if save_assets:
+        # Lighthouse names the saved assets after --output-path, so it has
+        # to write the report itself in this case.
+        cmd.extend([f"--output-path={out_file}", "--save-assets"])
+    else:
+        cmd.append("--output-path=stdout")
 
     # Add mobile or desktop flags
     if mode == "mobile":
@@ -99,33 +212,134 @@ def run_lighthouse(
     # Append any unknown LH flags (e.g., --verbose)
     cmd.extend(extra_flags)
 
-    logging.debug(f"Full Lighthouse command: {' '.join(cmd)}")
+    if port:
+        cmd.append(f"--port={port}")
+
+    # Our own Chrome flags (and so a throwaway profile) are only needed when
+    # Lighthouse launches Chrome and the user didn't supply --chrome-flags.
+    use_default_flags = not port and not any("--chrome-flags" in f for f in extra_flags)
+    with _temp_profile() if use_default_flags else nullcontext() as profile_dir:
+        if use_default_flags:
+            default_flags = [*BATCH_CHROME_FLAGS, f'--user-data-dir="{profile_dir}"']
+            cmd.append(f'--chrome-flags="{" ".join(default_flags)}"')
+
+        logging.debug(f"Full Lighthouse command: {' '.join(cmd)}")
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout_secs)
+        except asyncio.TimeoutError:
+            _kill(proc)
+            await proc.wait()
+            logging.error(f"Lighthouse timed out after {timeout_secs}s ({mode}): {url}")
+            return None
+        except asyncio.CancelledError:
+            # Don't leave an orphaned Lighthouse/Chrome behind on Ctrl+C.
+            _kill(proc)
+            await proc.wait()
+            raise
+
+    logging.debug(f"--- LH STDERR ---\n{stderr.decode(errors='replace')}")
+
+    if proc.returncode != 0:
+        logging.error(f"Lighthouse error (exit code {proc.returncode}) for {url} ({mode})")
+        logging.error(f"--- STDERR ---\n{stderr.decode(errors='replace')}")
+        return None
+
+    if not save_assets:
+        tmp_file = f"{out_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(stdout)
+        os.replace(tmp_file, out_file)
+
+    return out_file
+
+
+def _run_batch_process(
+    jobs: list[tuple[str, str, str]],
+    node_exe: str,
+    timeout_secs: int
+) -> list[tuple[str, str, Optional[str]]]:
+    """
+    Feed (url, mode, out_file) jobs to one batch_runner.mjs process and
+    return (url, mode, out_file or None) for each job.
+    """
+    payload = {
+        "jobs": [{"url": url, "mode": mode, "outputPath": out_file} for url, mode, out_file in jobs],
+        "chromeFlags": BATCH_CHROME_FLAGS,
+        "categories": list(LIGHTHOUSE_CATEGORIES),
+        "maxWaitForLoad": timeout_secs * 1000,
+    }
+    cmd = [node_exe, BATCH_RUNNER_JS]
+    logging.debug(f"Starting Lighthouse batch runner for {len(jobs)} jobs: {' '.join(cmd)}")
 
     try:
         proc = subprocess.run(
             cmd,
+            input=json.dumps(payload),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            check=True,
-            timeout=timeout_secs
+            timeout=timeout_secs * len(jobs)
         )
-        logging.debug(f"--- LH STDOUT ---\n{proc.stdout}")
-        logging.debug(f"--- LH STDERR ---\n{proc.stderr}")
+        stdout = proc.stdout
+        if proc.returncode != 0:
+            logging.error(f"Lighthouse batch runner exited with code {proc.returncode}")
+            logging.error(f"--- STDERR ---\n{proc.stderr}")
+    except subprocess.TimeoutExpired as e:
+        logging.error(f"Lighthouse batch runner timed out after {timeout_secs * len(jobs)}s")
+        stdout = e.stdout or ""
+        if isinstance(stdout, bytes):
+            stdout = stdout.decode("utf-8", errors="replace")
+    except OSError as e:
+        logging.error(f"Could not start the Lighthouse batch runner with Node.js '{node_exe}': {e}")
+        stdout = ""
 
-        # *** Post-run sleep *** to let Windows release file locks
-        time.sleep(2)
+    finished = {}
+    for line in stdout.splitlines():
+        try:
+            record = loads_json(line)
+        except ValueError:
+            continue
+        if record.get("ok"):
+            finished[(record["url"], record["mode"])] = record["outputPath"]
+        else:
+            logging.error(f"Lighthouse error for {record.get('url')} ({record.get('mode')}): {record.get('error')}")
 
-        return out_file
+    return [(url, mode, finished.get((url, mode))) for url, mode, _ in jobs]
 
-    except subprocess.TimeoutExpired as e:
-        logging.error(f"Lighthouse timed out after {timeout_secs}s ({mode}): {url}")
-        logging.error(f"--- STDOUT (partial) ---\n{e.stdout}")
-        logging.error(f"--- STDERR (partial) ---\n{e.stderr}")
-        return None
+def run_lighthouse_batch(
+    jobs: list[tuple[str, str, str]],
+    node_exe: str = "node",
+    workers: int = 1,
+    timeout_secs: int = 120,
+    resume: bool = False
+) -> list[tuple[str, str, Optional[str]]]:
+    """
+    Run (url, mode, output_dir) jobs through the Node batch runner, split
+    across `workers` runner processes. Each process launches Chrome once and
+    reuses it for all of its jobs, instead of one Node + Chrome start per URL.
+    Report paths match run_lighthouse's naming. With resume=True, jobs whose
+    report already exists are not rerun. Returns
+    (url, mode, report_path or None) per job.
+    """
+    prepared = [
+        (url, mode, os.path.join(output_dir, f"{safe_name(url)}_{mode}.json"))
+        for url, mode, output_dir in jobs
+    ]
+    results = []
+    if resume:
+        results = [job for job in prepared if has_report(job[2])]
+        prepared = [job for job in prepared if not has_report(job[2])]
+        if results:
+            logging.info(f"Reusing {len(results)} existing reports")
+    chunks = [chunk for chunk in (prepared[i::max(1, workers)] for i in range(max(1, workers))) if chunk]
 
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Lighthouse error (exit code != 0) for {url} ({mode}): {e}")
-        logging.error(f"--- STDOUT ---\n{e.stdout}")
-        logging.error(f"--- STDERR ---\n{e.stderr}")
-        return None
+    with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as executor:
+        for chunk_results in executor.map(lambda c: _run_batch_process(c, node_exe, timeout_secs), chunks):
+            results.extend(chunk_results)
+    return results
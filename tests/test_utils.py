@@ -1,5 +1,16 @@
+import io
+import gzip
+import sys
+import time
+import json
+import asyncio
 import pytest
+import pandas as pd
+from lighthouse_bulk_scan import cli
 from lighthouse_bulk_scan.cli import parse_display_value
+from lighthouse_bulk_scan.report import REPORT_COLUMNS, extract_detailed_data
+from lighthouse_bulk_scan.runner import safe_name
+from lighthouse_bulk_scan import report, runner, sitemap, sitemap_async
 from lighthouse_bulk_scan.sitemap import is_html_page
 
 @pytest.mark.parametrize("val,expected", [
@@ -11,9 +22,394 @@ from lighthouse_bulk_scan.sitemap import is_html_page
 def test_parse_display_value(val, expected):
     assert parse_display_value(val) == expected
 
+def test_parse_display_values_matches_scalar():
+    values = ["1.2 s", "240 ms", "1,234 ms", "", "n/a"]
+    parsed = cli.parse_display_values(pd.Series(values, dtype=object))
+    assert [None if pd.isna(v) else v for v in parsed] == [parse_display_value(v) for v in values]
+
 @pytest.mark.parametrize("url,expected", [
     ("https://example.com/index.html", True),
     ("https://example.com/image.png", False),
+    ("https://example.com/Report.PDF", False),
+    ("https://example.com/png", True),
+    ("https://example.com/logo.png?v=2", False),
+    ("https://example.com/brochure.pdf#page=3", False),
+    ("https://example.com/page?ref=a.b", True),
 ])
 def test_is_html_page(url, expected):
     assert is_html_page(url) == expected
+
+def test_parse_sitemaps_follows_indexes_once(monkeypatch):
+    tree = {
+        "https://example.com/index.xml": (["https://example.com/a.xml", "https://example.com/b.xml"], []),
+        "https://example.com/a.xml": (["https://example.com/index.xml"], ["https://example.com/1"]),
+        "https://example.com/b.xml": ([], ["https://example.com/2", "https://example.com/1.pdf"]),
+    }
+    fetched = []
+
+    def fake_fetch(url):
+        fetched.append(url)
+        return tree[url]
+
+    monkeypatch.setattr(sitemap, "_fetch_sitemap", fake_fetch)
+    urls = sitemap.parse_sitemaps(["https://example.com/index.xml"])
+    assert sorted(urls) == ["https://example.com/1", "https://example.com/2"]
+    assert sorted(fetched) == sorted(tree)
+
+def test_parse_sitemaps_handles_deep_index_chains(monkeypatch):
+    depth = sys.getrecursionlimit() + 100
+
+    def fake_fetch(url):
+        level = int(url.rsplit("/", 1)[1])
+        if level == depth:
+            return [], ["https://example.com/page"]
+        return [f"https://example.com/{level + 1}"], []
+
+    monkeypatch.setattr(sitemap, "_fetch_sitemap", fake_fetch)
+    assert sitemap.parse_sitemaps(["https://example.com/0"]) == ["https://example.com/page"]
+
+def test_parse_sitemaps_stops_wide_index_early(monkeypatch):
+    shards = [f"https://example.com/{i}.xml" for i in range(5000)]
+    fetched = []
+
+    def fake_fetch(url):
+        fetched.append(url)
+        if url == "https://example.com/index.xml":
+            return shards, []
+        time.sleep(0.005)
+        return [], [url.replace(".xml", ".html")]
+
+    monkeypatch.setattr(sitemap, "_fetch_sitemap", fake_fetch)
+    urls = sitemap.parse_sitemaps(["https://example.com/index.xml"], max_urls=10)
+    assert len(urls) == 10
+    assert len(fetched) < len(shards)
+
+def test_parse_sitemaps_dedupes_and_caps(monkeypatch):
+    pages = ["https://example.com/1", "https://example.com/2", "https://example.com/1", "https://example.com/3"]
+    monkeypatch.setattr(sitemap, "_fetch_sitemap", lambda url: ([], pages))
+    assert sitemap.parse_sitemaps(["https://example.com/s.xml"]) == pages[:2] + pages[3:]
+    assert sitemap.parse_sitemaps(["https://example.com/s.xml"], max_urls=2) == pages[:2]
+
+def test_parse_sitemap_xml_splits_indexes_and_pages():
+    xml = b"""<?xml version="1.0" encoding="UTF-8"?>
+    <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+      <url><loc> https://example.com/about </loc></url>
+      <url><loc>https://example.com/logo.png</loc></url>
+      <sitemap><loc>https://example.com/child.xml</loc></sitemap>
+    </urlset>"""
+    children, pages = sitemap._parse_sitemap_xml(io.BytesIO(xml))
+    assert children == ["https://example.com/child.xml"]
+    assert pages == ["https://example.com/about", "https://example.com/logo.png"]
+
+def test_parse_sitemap_xml_ignores_extension_locs():
+    xml = b"""<?xml version="1.0" encoding="UTF-8"?>
+    <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+            xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+      <url>
+        <loc>https://example.com/gallery</loc>
+        <image:image><image:loc>https://example.com/photo.jpg</image:loc></image:image>
+      </url>
+    </urlset>"""
+    assert sitemap._parse_sitemap_xml(io.BytesIO(xml)) == ([], ["https://example.com/gallery"])
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_parse_sitemap_xml_accepts_gzipped_files(compress):
+    xml = b"""<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+      <url><loc>https://example.com/a</loc></url></urlset>"""
+    body = gzip.compress(xml) if compress else xml
+    stream = sitemap._maybe_gunzip(io.BytesIO(body))
+    assert sitemap._parse_sitemap_xml(stream) == ([], ["https://example.com/a"])
+
+@pytest.mark.parametrize("content_encoding, gzip_file", [(None, False), ("gzip", False), (None, True), ("gzip", True)])
+def test_fetch_sitemap_decodes_real_urllib3_responses(monkeypatch, content_encoding, gzip_file):
+    urllib3 = pytest.importorskip("urllib3")
+    xml = b"<urlset>" + b"".join(
+        b"<url><loc>https://example.com/%d</loc></url>" % i for i in range(2000)
+    ) + b"</urlset>"
+    body = gzip.compress(xml) if gzip_file else xml
+    if content_encoding:
+        body = gzip.compress(body)
+    response = FakeStreamResponse(200)
+    response.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body),
+        headers={"Content-Encoding": content_encoding} if content_encoding else {},
+        status=200,
+        preload_content=False,
+    )
+    monkeypatch.setattr(sitemap.SESSION, "get", lambda url, **kw: response)
+    children, pages = sitemap._fetch_sitemap("https://example.com/sitemap.xml")
+    assert pages == [f"https://example.com/{i}" for i in range(2000)]
+
+def test_filter_html_pages():
+    urls = ["https://example.com/a", "https://example.com/B.JPG", "https://example.com/c.html"]
+    assert sitemap.filter_html_pages(urls) == ["https://example.com/a", "https://example.com/c.html"]
+    assert sitemap.filter_html_pages([]) == []
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_extract_detailed_data(tmp_path, monkeypatch, streamed):
+    if streamed:
+        pytest.importorskip("ijson")
+        monkeypatch.setattr(report, "STREAM_THRESHOLD_BYTES", 0)
+    report_path = tmp_path / "report.json"
+    report_path.write_text(json.dumps({
+        "finalDisplayedUrl": "https://example.com/",
+        "requestedUrl": "https://example.com",
+        "categories": {"performance": {"score": 0.9}},
+        "audits": {"first-contentful-paint": {"displayValue": "1.2 s"}},
+        "timing": {"total": 1234.5},
+    }))
+    data = extract_detailed_data(str(report_path), "mobile")
+    assert data["mode"] == "mobile"
+    assert data["url"] == "https://example.com/"
+    assert data["performance_score"] == 0.9
+    assert data["seo_score"] is None
+    assert data["first_contentful_paint"] == "1.2 s"
+    assert data["interactive"] == ""
+    assert data["timing_total"] == 1234.5
+
+def test_safe_name():
+    assert safe_name("https://example.com/a/b?x=1&y=2") == "example.com_a_b_x=1_y=2"
+    assert safe_name("http://example.com:8080/") == "example.com_8080_"
+    assert safe_name('https://example.com/a|b*"c"') == "example.com_a_b__c_"
+
+def test_extract_detailed_data_column_order(tmp_path):
+    report = tmp_path / "report.json"
+    report.write_text("{}")
+    assert tuple(extract_detailed_data(str(report), "desktop")) == REPORT_COLUMNS
+
+def test_parse_sitemaps_async_matches_sync(monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    tree = {
+        "https://example.com/index.xml": b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+            <sitemap><loc>https://example.com/a.xml</loc></sitemap></sitemapindex>""",
+        "https://example.com/a.xml": b"""<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+            <url><loc>https://example.com/1</loc></url><url><loc>https://example.com/1.pdf</loc></url></urlset>""",
+    }
+    tree["https://example.com/a.xml"] = gzip.compress(tree["https://example.com/a.xml"])
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=tree[str(request.url)]))
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kw: real_client(transport=transport))
+    assert sitemap_async.parse_sitemaps_async(["https://example.com/index.xml"]) == ["https://example.com/1"]
+
+class FakeResponse:
+    def __init__(self, url, status_code):
+        self.url = url
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+def test_get_valid_url_prefers_https(monkeypatch):
+    probed = []
+
+    def fake_head(url, **kwargs):
+        probed.append(url)
+        if url == "https://example.org":
+            raise sitemap.requests.ConnectionError("refused")
+        return FakeResponse(url + "/home", 200)
+
+    monkeypatch.setattr(sitemap.SESSION, "head", fake_head)
+    sitemap.get_valid_url.cache_clear()
+    assert sitemap.get_valid_url("example.org") == "https://www.example.org"
+    assert probed == ["https://example.org", "https://www.example.org"]
+
+def test_get_valid_url_falls_back_to_get_on_405(monkeypatch):
+    monkeypatch.setattr(sitemap.SESSION, "head", lambda url, **kw: FakeResponse(url, 405))
+    monkeypatch.setattr(sitemap.SESSION, "get", lambda url, **kw: FakeResponse(url, 200))
+    sitemap.get_valid_url.cache_clear()
+    assert sitemap.get_valid_url("https://example.net/") == "https://example.net"
+
+def test_fetch_sitemaps_from_robots(monkeypatch):
+    resp = FakeResponse("https://example.com/robots.txt", 200)
+    resp.raise_for_status = lambda: None
+    resp.text = (
+        "User-agent: *\nDisallow: /private\n"
+        "SITEMAP: https://example.com/a.xml\n"
+        "  sitemap:/b.xml\r\n"
+        "# Sitemap: https://example.com/commented.xml\n"
+        + "Disallow: /x\n" * 60000
+        + "Sitemap: https://example.com/past-the-cap.xml\n"
+    )
+    monkeypatch.setattr(sitemap.SESSION, "get", lambda url, **kw: resp)
+    assert sitemap.fetch_sitemaps_from_robots("https://example.com") == [
+        "https://example.com/a.xml",
+        "https://example.com/b.xml",
+    ]
+
+class FakeStreamResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.raw = io.BufferedReader(io.BytesIO(body))
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+def test_sitemap_cache_reuses_urls_on_304(monkeypatch, tmp_path):
+    cache_path = str(tmp_path / "sitemap_cache.json")
+    body = b'<urlset><url><loc>https://example.com/1</loc></url></urlset>'
+    sent = []
+    # Restored on teardown, so later tests fetch without the cache.
+    monkeypatch.setattr(sitemap, "_SITEMAP_CACHE", None)
+
+    def fake_get(url, headers=None, **kwargs):
+        sent.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeStreamResponse(304)
+        return FakeStreamResponse(200, body, {"ETag": '"v1"'})
+
+    monkeypatch.setattr(sitemap.SESSION, "get", fake_get)
+    for _ in range(2):
+        sitemap.enable_sitemap_cache(cache_path)
+        assert sitemap.parse_sitemaps(["https://example.com/s.xml"]) == ["https://example.com/1"]
+        sitemap.save_sitemap_cache()
+    assert sent == [{}, {"If-None-Match": '"v1"'}]
+
+def test_run_audits_respects_limits(monkeypatch, tmp_path):
+    in_flight = {"all": 0, "peak": 0}
+    host_peaks = {}
+
+    async def fake_run_lighthouse(url, mode, output_dir, **kwargs):
+        host = cli.get_domain_from_url(url)
+        in_flight["all"] += 1
+        in_flight[host] = in_flight.get(host, 0) + 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["all"])
+        host_peaks[host] = max(host_peaks.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight["all"] -= 1
+        in_flight[host] -= 1
+        return f"{url}_{mode}.json"
+
+    monkeypatch.setattr(cli, "run_lighthouse", fake_run_lighthouse)
+    # Grouped by host, as CSV input usually is.
+    hosts = ("a.com", "b.com", "c.com", "d.com")
+    jobs = [(f"https://{host}/{i}", 1, "desktop", str(tmp_path)) for host in hosts for i in range(4)]
+    finished = []
+    asyncio.run(cli.run_audits(jobs, concurrency=3, max_per_host=1,
+                               on_report=lambda *args: finished.append(args)))
+    assert sorted(args[0] for args in finished) == sorted(job[0] for job in jobs)
+    # Every slot stays busy with other hosts while one host is at its limit.
+    assert in_flight["peak"] == 3
+    assert host_peaks == dict.fromkeys(hosts, 1)
+
+def test_enable_http_cache_keeps_session_settings(monkeypatch, tmp_path):
+    pytest.importorskip("requests_cache")
+    monkeypatch.setattr(sitemap, "SESSION", sitemap.SESSION)
+    sitemap.enable_http_cache(str(tmp_path / "http_cache"), 60)
+    assert sitemap.SESSION.settings.expire_after == 60
+    assert sitemap.SESSION.headers["User-Agent"] == sitemap.HEADERS["User-Agent"]
+    assert sitemap.SESSION.get_adapter("https://example.com").max_retries.total == 2
+
+@pytest.mark.parametrize("use_arrow", [True, False])
+def test_read_csv_urls(monkeypatch, tmp_path, use_arrow):
+    if use_arrow:
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setitem(sys.modules, "pyarrow.csv", None)
+    path = tmp_path / "urls.csv"
+    path.write_text("https://a.com/x\n\n  https://b.com/y  \nhttps://c.com/z\n", encoding="utf-8")
+    assert cli.read_csv_urls(str(path), 99) == ["https://a.com/x", "https://b.com/y", "https://c.com/z"]
+    assert cli.read_csv_urls(str(path), 2) == ["https://a.com/x", "https://b.com/y"]
+    path.write_text("https://a.com/x\nhttps://b.com/y,extra\n", encoding="utf-8")
+    assert cli.read_csv_urls(str(path), 99) == ["https://a.com/x", "https://b.com/y"]
+    path.write_text("", encoding="utf-8")
+    assert cli.read_csv_urls(str(path), 99) == []
+
+def test_stream_report_row_stops_once_all_fields_seen():
+    pytest.importorskip("ijson")
+    full = {}
+    for column, path, default in report._FIELDS:
+        node = full
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = "x" if default == "" else 1
+    # Everything after the last kept field is never parsed, even if invalid.
+    body = json.dumps(full)[:-1] + ', "tail": [' + "1," * 100000
+    row = report._stream_report_row(io.BytesIO(body.encode()), "desktop")
+    assert row["timing_total"] == 1
+    assert row["url"] == "x"
+
+def test_extract_detailed_data_runs_in_process_pool(tmp_path):
+    import signal
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"report_{i}.json"
+        path.write_text(json.dumps({"finalDisplayedUrl": f"https://example.com/{i}"}))
+        paths.append(str(path))
+    with cli.make_report_pool() as pool:
+        rows = list(pool.map(extract_detailed_data, paths, ["desktop"] * len(paths)))
+        # Ctrl+C must not kill workers that still have reports queued.
+        assert pool.submit(signal.getsignal, signal.SIGINT).result() == signal.SIG_IGN
+    assert [row["url"] for row in rows] == [f"https://example.com/{i}" for i in range(3)]
+
+def test_write_parsed_rows_keeps_order_and_skips_failures():
+    import csv
+    from collections import deque
+    from concurrent.futures import Future
+
+    def future(result=None, error=None):
+        f = Future()
+        if error:
+            f.set_exception(error)
+        else:
+            f.set_result(result)
+        return f
+
+    pending = Future()
+    parsed = deque([
+        (future({"url": "a"}), 1),
+        (future({}), 1),
+        (future(error=ValueError("bad json")), 2),
+        (pending, 2),
+        (future({"url": "c"}), 3),
+    ])
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=cli.RESULT_COLUMNS, extrasaction="ignore")
+    assert cli.write_parsed_rows(parsed, writer) == 1
+    assert len(parsed) == 2
+    pending.set_result({"url": "b"})
+    assert cli.write_parsed_rows(parsed, writer, wait_all=True) == 2
+    rows = list(csv.DictReader(io.StringIO(out.getvalue()), fieldnames=cli.RESULT_COLUMNS))
+    assert [(row["url"], row["run_iteration"]) for row in rows] == [("a", "1"), ("b", "2"), ("c", "3")]
+
+def test_run_lighthouse_cancelled_after_child_exited(monkeypatch, tmp_path):
+    # Ctrl+C reaches Lighthouse too, so it can exit before our task is cancelled.
+    real_wait_for = asyncio.wait_for
+
+    async def exit_then_cancel(aw, timeout):
+        await real_wait_for(aw, timeout)
+        await asyncio.sleep(0.1)
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(runner.asyncio, "wait_for", exit_then_cancel)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(runner.run_lighthouse(
+            "https://example.com", "desktop", str(tmp_path), sys.executable, []
+        ))
+
+@pytest.mark.parametrize("port, extra_flags, profiles", [(None, [], 1), (9222, [], 0), (None, ["--chrome-flags=--headless"], 0)])
+def test_run_lighthouse_only_makes_a_profile_when_launching_chrome(monkeypatch, tmp_path, port, extra_flags, profiles):
+    made = []
+    real_mkdtemp = runner.tempfile.mkdtemp
+
+    def counting_mkdtemp(**kwargs):
+        made.append(kwargs)
+        return real_mkdtemp(**kwargs)
+
+    monkeypatch.setattr(runner.tempfile, "mkdtemp", counting_mkdtemp)
+    asyncio.run(runner.run_lighthouse(
+        "https://example.com", "desktop", str(tmp_path), sys.executable, extra_flags, port=port
+    ))
+    assert len(made) == profiles
+
+def test_run_batch_process_reports_missing_node(tmp_path, caplog):
+    jobs = [("https://example.com", "desktop", str(tmp_path / "a.json"))]
+    missing_node = str(tmp_path / "no-such-node")
+    assert runner._run_batch_process(jobs, missing_node, timeout_secs=5) == [("https://example.com", "desktop", None)]
+    assert missing_node in caplog.text